@@ -2,20 +2,23 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 from sqlalchemy.sql.expression import func
 
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, QuestionStat, CategoryStat, PlayerStat
+from results import ResultsBuffer
 
 QUESTIONS_PER_PAGE = 10
+QUESTIONS_PER_PLAY = 5  # matches questionsPerPlay in QuizView.js
+LEADERBOARD_SIZE = 10
 
 
-def paginate(reqest, items):
+def paginate(request, selection):
     '''
     Returns a list with paginated items
+    Only the rows for the requested page are fetched from the database.
     Args:
         request: object
-        items: list
+        selection: query
     Returns:
         available_items: an indexed list of paginated items
     '''
@@ -23,13 +26,13 @@ def paginate(reqest, items):
     page = request.args.get('page', 1, type=int)
     # set starting index (account for 0 index)
     start = (page - 1) * QUESTIONS_PER_PAGE
-    # set ending index
-    end = start + QUESTIONS_PER_PAGE
+
+    items = selection.limit(QUESTIONS_PER_PAGE).offset(start).all()
 
     # format
     available_items = [item.format() for item in items]
 
-    return available_items[start:end]
+    return available_items
 
 
 def create_app(test_config=None):
@@ -39,6 +42,10 @@ def create_app(test_config=None):
     setup_db(app)
     db = SQLAlchemy()
 
+    # quiz results are aggregated in memory and flushed in batches
+    results = ResultsBuffer(app)
+    app.extensions['results'] = results
+
     # ✅ @TODO: Delete the sample route after completing the TODOs
     # ✅ @TODO: Set up CORS. Allow '*' for origins.
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -112,24 +119,26 @@ def create_app(test_config=None):
 
                 questions = Question.query.order_by('id').filter(
                     Question.category == curr_category_id
-                ).all()
+                )
                 paginated_questions = paginate(request, questions)
             else:
-                questions = Question.query.all()
+                questions = Question.query.order_by('id')
                 paginated_questions = paginate(request, questions)
+            # the ordering is only needed for the page, not the total
+            total_questions = questions.order_by(None).count()
 
             ordered_categories = Category.query.order_by('id').all()
             categories_list = [category.type
                                for category in ordered_categories]
 
-            if len(categories_list) == 0 | len(questions) == 0:
+            if len(categories_list) == 0 | total_questions == 0:
                 abort(404)
 
             return jsonify({
                 'success': True,
                 'status_code': 200,
                 'questions': paginated_questions,
-                'total_questions': len(questions),
+                'total_questions': total_questions,
                 'current_category': curr_category.type,
                 'categories': categories_list,
             })
@@ -249,14 +258,17 @@ def create_app(test_config=None):
             abort(422)
 
         try:
-            questions = Question.query.filter(
-                Question.question.ilike('%{}%'.format(search_term))).all()
-
-            if not questions:
-                abort(422)
+            questions = Question.query.order_by('id').filter(
+                Question.question.ilike('%{}%'.format(search_term)))
 
             paginated_questions = paginate(request, questions)
 
+            # an empty page is only an error when nothing matches at all,
+            # a page past the last one returns an empty list
+            if not paginated_questions and not db.session.query(
+                    questions.order_by(None).exists()).scalar():
+                abort(422)
+
             return jsonify({
                 'success': True,
                 'status': 200,
@@ -292,8 +304,8 @@ def create_app(test_config=None):
                 Category.id == curr_category_id).one_or_none()
 
             all_categories = Category.query.all()
-            questions = Question.query.filter(
-                Question.category == curr_category_id).all()
+            questions = Question.query.order_by('id').filter(
+                Question.category == curr_category_id)
 
             paginated_questions = paginate(request, questions)
 
@@ -338,19 +350,20 @@ def create_app(test_config=None):
             if not category == None:
                 if "previous_questions" in data and len(previous_questions) > 0:
                     questions = Question.query.filter(Question.id.notin_(
-                        previous_questions), Question.category == category.id).all()
+                        previous_questions), Question.category == category.id)
                 else:
                     questions = Question.query.filter(
-                        Question.category == category.id).all()
+                        Question.category == category.id)
             else:
                 if "previous_questions" in data and len(previous_questions) > 0:
                     questions = Question.query.filter(
-                        Question.id.notin_(previous_questions)).all()
+                        Question.id.notin_(previous_questions))
                 else:
-                    questions = Question.query.all()
-            max = len(questions) - 1
-            if max > 0:
-                question = questions[random.randint(0, max)].format()
+                    questions = Question.query
+            # let the database pick the random question
+            next_question = questions.order_by(func.random()).first()
+            if next_question is not None:
+                question = next_question.format()
             else:
                 question = False
             return jsonify({
@@ -361,6 +374,153 @@ def create_app(test_config=None):
         except:
             abort(500, 'An error occured while trying to load the next question')
 
+    '''
+    Create a POST endpoint to record the answers of a finished quiz.
+
+    Answers are aggregated in memory per question, category and player,
+    and written to the database in batches every few seconds.
+    Args:
+        player: str representing the player name
+        answers: list of {'question_id': int, 'correct': bool}
+    Returns:
+        recorded: int of answers recorded
+    '''
+    @app.route('/quizzes/results', methods=['POST'])
+    def record_results():
+        if not request.method == 'POST':
+            abort(405)
+
+        data = request.get_json()
+        try:
+            player = str(data['player']).strip()
+            # a game can't answer more questions than the quiz plays
+            if len(data['answers']) > QUESTIONS_PER_PLAY:
+                abort(422)
+            answers = {int(answer['question_id']): answer['correct']
+                       for answer in data['answers']}
+        except:
+            abort(422)
+
+        if not player or not answers:
+            abort(422)
+
+        # each question is asked once per game
+        if len(answers) != len(data['answers']):
+            abort(422)
+
+        # only real booleans, so "false" or 0 can't count as correct
+        if not all(isinstance(correct, bool) for correct in answers.values()):
+            abort(422)
+
+        try:
+            # one indexed lookup validates the ids and finds their categories
+            questions = Question.query.with_entities(
+                Question.id, Question.category).filter(
+                Question.id.in_(list(answers))).all()
+        except:
+            abort(422)
+
+        # every answer must match a question, partial games are rejected
+        if len(questions) != len(answers):
+            abort(422)
+
+        # questions keep a null category once theirs is deleted
+        results.record(player, [
+            (question.id,
+             int(question.category) if question.category is not None else None,
+             answers[question.id])
+            for question in questions])
+
+        return jsonify({
+            'success': True,
+            'status': 200,
+            'recorded': len(questions)
+        })
+
+    '''
+    Create a GET endpoint for the quiz leaderboard.
+
+    Returns the top players by best score, read from the flushed aggregates.
+    Returns:
+        leaderboard: list of objects representing player scores
+    '''
+    @app.route('/quizzes/leaderboard', methods=['GET'])
+    def get_leaderboard():
+        if not request.method == 'GET':
+            abort(405)
+
+        try:
+            players = PlayerStat.query.order_by(
+                PlayerStat.best_score.desc(),
+                PlayerStat.correct.desc()).limit(LEADERBOARD_SIZE).all()
+
+            return jsonify({
+                'success': True,
+                'status': 200,
+                'leaderboard': [player.format() for player in players]
+            })
+        except:
+            abort(422)
+
+    '''
+    Create a GET endpoint for the answer accuracy of a question.
+
+    Returns the aggregated attempts and correct answers for a question,
+    or 404 if no answers have been recorded for it
+    Args:
+        question_id: int representing the id of the question
+    Returns:
+        stats: object with attempts, correct and accuracy
+    '''
+    @app.route('/questions/<int:question_id>/stats', methods=['GET'])
+    def get_question_stats(question_id):
+        if not request.method == 'GET':
+            abort(405)
+
+        try:
+            stats = QuestionStat.query.get(question_id)
+        except:
+            abort(422)
+
+        if stats is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'status': 200,
+            'stats': stats.format()
+        })
+
+    '''
+    Create a GET endpoint for the answer accuracy of a category.
+
+    Returns the aggregated attempts and correct answers for a category,
+    or 404 if no answers have been recorded for it
+    Args:
+        category_id: int representing the 0-based index of the category,
+            as used by /categories/<category_id>/questions
+    Returns:
+        stats: object with attempts, correct and accuracy
+    '''
+    @app.route('/categories/<int:category_id>/stats', methods=['GET'])
+    def get_category_stats(category_id):
+        if not request.method == 'GET':
+            abort(405)
+
+        try:
+            stats = CategoryStat.query.get(category_id + 1)
+        except:
+            abort(422)
+
+        if stats is None:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'status': 200,
+            'stats': stats.format()
+        })
+
     # ✅ @TODO: Create error handlers for all expected errors including 404 and 422.
     @app.errorhandler(404)
     def not_found(e):
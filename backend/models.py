@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -34,6 +34,10 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    # serves WHERE category = ? ORDER BY id pages with a single index scan
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
@@ -88,3 +92,79 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuestionStat
+    aggregated answer counters for a question, written by results.ResultsBuffer
+'''
+
+
+class QuestionStat(db.Model):
+    __tablename__ = 'question_stats'
+
+    question_id = Column(Integer, ForeignKey('questions.id', ondelete='CASCADE'),
+                         primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+    def format(self):
+        return {
+            'question_id': self.question_id,
+            'attempts': self.attempts,
+            'correct': self.correct,
+            'accuracy': accuracy(self.correct, self.attempts)
+        }
+
+
+'''
+CategoryStat
+    aggregated answer counters for a category, written by results.ResultsBuffer
+'''
+
+
+class CategoryStat(db.Model):
+    __tablename__ = 'category_stats'
+
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete='CASCADE'),
+                         primary_key=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+    def format(self):
+        return {
+            # the 0-based index used by the /categories/<id>/... routes
+            'category_id': self.category_id - 1,
+            'attempts': self.attempts,
+            'correct': self.correct,
+            'accuracy': accuracy(self.correct, self.attempts)
+        }
+
+
+'''
+PlayerStat
+    aggregated quiz scores for a player, used for the leaderboard
+'''
+
+
+class PlayerStat(db.Model):
+    __tablename__ = 'player_stats'
+
+    player = Column(String, primary_key=True)
+    games = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+    best_score = Column(Integer, nullable=False, default=0, index=True)
+
+    def format(self):
+        return {
+            'player': self.player,
+            'games': self.games,
+            'correct': self.correct,
+            'best_score': self.best_score
+        }
+
+
+def accuracy(correct, attempts):
+    if not attempts:
+        return 0
+    return round(correct / attempts, 3)
@@ -0,0 +1,177 @@
+import json
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+'''
+query_audit
+    records the SQL statements issued while a block of code runs, so tests
+    can put a ceiling on how many statements and rows an endpoint costs,
+    and (on Postgres) check that its filters are served by indexes.
+'''
+
+
+class QueryRecorder(object):
+    '''
+    Collects every statement executed on an engine while active.
+
+    Each entry in `statements` is a dict with the keys:
+        statement: str of the SQL sent to the database
+        parameters: the DBAPI parameters sent with it
+        rows: int of rows returned (0 when the driver does not report it)
+    '''
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        # psycopg2 buffers SELECT results client side, so rowcount is the
+        # number of rows fetched; other drivers may report -1
+        rows = 0
+        if cursor.description is not None and cursor.rowcount > 0:
+            rows = cursor.rowcount
+        self.statements.append({
+            'statement': statement,
+            'parameters': parameters,
+            'rows': rows,
+        })
+
+    def __enter__(self):
+        event.listen(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'after_cursor_execute',
+                     self._after_cursor_execute)
+        return False
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def rows(self):
+        return sum(entry['rows'] for entry in self.statements)
+
+    def selects(self):
+        return [entry for entry in self.statements
+                if entry['statement'].lstrip().upper().startswith('SELECT')]
+
+    def report(self):
+        return '\n'.join(
+            '  [{} rows] {}'.format(entry['rows'],
+                                    ' '.join(entry['statement'].split()))
+            for entry in self.statements)
+
+
+def explain(engine, statement, parameters):
+    '''
+    Returns the Postgres plan for a recorded statement
+    Sequential scans and sorts are disabled for the duration of the EXPLAIN
+    so the tiny test tables plan like large ones: a missing index can't hide
+    behind a cheap seq scan, and an ORDER BY ... LIMIT page whose filter and
+    ordering no single index serves shows up as a filtered index walk.
+    Args:
+        engine: sqlalchemy engine bound to a postgres database
+        statement: str of recorded SQL
+        parameters: DBAPI parameters recorded with the statement
+    Returns:
+        plan: dict representing the root plan node
+    '''
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('SET LOCAL enable_sort = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        result = cursor.fetchone()[0]
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result[0]['Plan']
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+def seq_scans(plan):
+    '''
+    Returns the names of all relations read without using an index
+    With sequential scans disabled the planner can still walk a whole index
+    (e.g. the primary key, for ORDER BY id) and apply the WHERE clause as a
+    Filter, so index scans with a Filter but no index condition count too.
+    Args:
+        plan: dict representing a plan node returned by explain()
+    Returns:
+        relations: list of table names
+    '''
+    relations = []
+    node_type = plan.get('Node Type')
+    if node_type == 'Seq Scan':
+        relations.append(plan.get('Relation Name'))
+    elif (node_type in ('Index Scan', 'Index Only Scan')
+          and 'Filter' in plan
+          and 'Index Cond' not in plan
+          and 'Recheck Cond' not in plan):
+        relations.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        relations.extend(seq_scans(child))
+    return relations
+
+
+class QueryAuditMixin(object):
+    '''
+    unittest.TestCase mixin exposing query budget and query plan assertions.
+
+    Test cases using it must provide `self.app`, a flask app bound to
+    models.db.
+    '''
+
+    def _engine(self):
+        with self.app.app_context():
+            return db.engine
+
+    @contextmanager
+    def assertQueryBudget(self, max_statements, max_rows):
+        '''
+        Fails if the wrapped block issues more than `max_statements`
+        statements or fetches more than `max_rows` rows in total.
+        Yields the QueryRecorder so the block can inspect it further.
+        '''
+        with QueryRecorder(self._engine()) as recorder:
+            yield recorder
+
+        self.assertLessEqual(
+            recorder.count, max_statements,
+            'Expected at most {} statements, got {}:\n{}'.format(
+                max_statements, recorder.count, recorder.report()))
+        self.assertLessEqual(
+            recorder.rows, max_rows,
+            'Expected at most {} rows fetched, got {}:\n{}'.format(
+                max_rows, recorder.rows, recorder.report()))
+
+    def assertUsesIndexes(self, recorder, tables):
+        '''
+        Fails if any filtered SELECT recorded by `recorder` reads one of
+        `tables` without using an index for its filter. Skipped on
+        non-postgres databases.
+        '''
+        engine = self._engine()
+        if engine.dialect.name != 'postgresql':
+            self.skipTest('query plans are only checked on postgres')
+
+        for entry in recorder.selects():
+            if not re.search(r'\bWHERE\b', entry['statement'], re.I):
+                continue
+            plan = explain(engine, entry['statement'], entry['parameters'])
+            scanned = [table for table in seq_scans(plan) if table in tables]
+            self.assertFalse(
+                scanned,
+                'Unindexed scan on {} for:\n  {}'.format(
+                    ', '.join(scanned),
+                    ' '.join(entry['statement'].split())))
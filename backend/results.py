@@ -0,0 +1,211 @@
+import atexit
+import threading
+import weakref
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Question, Category, QuestionStat, CategoryStat, PlayerStat
+
+RESULTS_FLUSH_INTERVAL = 10  # seconds between writes to the database
+
+'''
+results
+    buffers quiz answer events in memory and periodically writes the
+    aggregated counters to the database, so peak quiz traffic costs one
+    batched upsert per table per interval instead of one row per answer.
+'''
+
+# every live buffer, flushed once at interpreter exit by _stop_all
+_buffers = weakref.WeakSet()
+
+
+class ResultsBuffer(object):
+    '''
+    In memory counters for quiz results, keyed by question, category and
+    player. Counters are swapped out under a lock and flushed in batches.
+    Args:
+        app: flask app bound to models.db
+        interval: int of seconds between background flushes
+    '''
+
+    def __init__(self, app, interval=RESULTS_FLUSH_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset()
+        _buffers.add(self)
+
+    def _reset(self):
+        # {question_id: [attempts, correct]}
+        self.questions = {}
+        # {category_id: [attempts, correct]}
+        self.categories = {}
+        # {player: [games, correct, best_score]}
+        self.players = {}
+
+    def record(self, player, answers):
+        '''
+        Adds a finished quiz to the buffer
+        Args:
+            player: str representing the player name
+            answers: list of (question_id, category_id, correct) tuples,
+                category_id is None for questions without a category
+        '''
+        score = 0
+        with self._lock:
+            for question_id, category_id, correct in answers:
+                hit = 1 if correct else 0
+                score += hit
+                counts = self.questions.setdefault(question_id, [0, 0])
+                counts[0] += 1
+                counts[1] += hit
+                if category_id is None:
+                    continue
+                counts = self.categories.setdefault(category_id, [0, 0])
+                counts[0] += 1
+                counts[1] += hit
+
+            counts = self.players.setdefault(player, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += score
+            counts[2] = max(counts[2], score)
+
+        self.start()
+
+    def _merge(self, questions, categories, players):
+        # puts counters from a failed flush back so they are retried
+        with self._lock:
+            for key, (attempts, correct) in questions.items():
+                counts = self.questions.setdefault(key, [0, 0])
+                counts[0] += attempts
+                counts[1] += correct
+            for key, (attempts, correct) in categories.items():
+                counts = self.categories.setdefault(key, [0, 0])
+                counts[0] += attempts
+                counts[1] += correct
+            for key, (games, correct, best) in players.items():
+                counts = self.players.setdefault(key, [0, 0, 0])
+                counts[0] += games
+                counts[1] += correct
+                counts[2] = max(counts[2], best)
+
+    def flush(self):
+        '''
+        Writes the buffered counters with one multi-row upsert per table
+        Returns:
+            flushed: int of aggregate rows written
+        '''
+        with self._lock:
+            questions = self.questions
+            categories = self.categories
+            players = self.players
+            self._reset()
+
+        if not (questions or categories or players):
+            return 0
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    _upsert_counts(connection, QuestionStat, 'question_id',
+                                   Question.id, questions)
+                    _upsert_counts(connection, CategoryStat, 'category_id',
+                                   Category.id, categories)
+                    _upsert_players(connection, players)
+        except Exception:
+            self.app.logger.exception(
+                'Failed to flush quiz results, will retry')
+            self._merge(questions, categories, players)
+            raise
+
+        return len(questions) + len(categories) + len(players)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                # counters were merged back, try again next interval
+                pass
+
+    def start(self):
+        '''
+        Starts the background flush thread if it is not already running
+        '''
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self):
+        '''
+        Stops the background flush thread and writes any pending counters
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+@atexit.register
+def _stop_all():
+    # write out whatever is still buffered when the process exits; a failed
+    # flush is already logged, keep going so the other buffers get written
+    for buffer in list(_buffers):
+        try:
+            buffer.stop()
+        except Exception:
+            pass
+
+
+def _upsert_counts(connection, model, key, parent_id, counts):
+    if not counts:
+        return
+    # drop counters for questions or categories deleted since they were
+    # buffered, otherwise the foreign key would fail every retry
+    existing = set(row[0] for row in connection.execute(
+        select([parent_id]).where(parent_id.in_(list(counts)))))
+    rows = [
+        {key: item, 'attempts': attempts, 'correct': correct}
+        for item, (attempts, correct) in counts.items()
+        if item in existing
+    ]
+    if not rows:
+        return
+    table = model.__table__
+    # a single multi-row INSERT ... ON CONFLICT, keys are unique per batch
+    statement = insert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c[key]],
+        set_={
+            'attempts': table.c.attempts + statement.excluded.attempts,
+            'correct': table.c.correct + statement.excluded.correct,
+        })
+    connection.execute(statement)
+
+
+def _upsert_players(connection, players):
+    if not players:
+        return
+    table = PlayerStat.__table__
+    statement = insert(table).values([
+        {'player': player, 'games': games, 'correct': correct,
+         'best_score': best}
+        for player, (games, correct, best) in players.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.player],
+        set_={
+            'games': table.c.games + statement.excluded.games,
+            'correct': table.c.correct + statement.excluded.correct,
+            'best_score': db.func.greatest(table.c.best_score,
+                                           statement.excluded.best_score),
+        })
+    connection.execute(statement)
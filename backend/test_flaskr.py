@@ -1,12 +1,17 @@
 import os
 import unittest
 import json
+import uuid
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, Question, Category, PlayerStat
+import results
+from results import ResultsBuffer
+from query_audit import QueryAuditMixin, QueryRecorder, seq_scans
 
 
-class TriviaTestCase(unittest.TestCase):
+class TriviaTestCase(QueryAuditMixin, unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
@@ -40,7 +45,7 @@ class TriviaTestCase(unittest.TestCase):
 
     def tearDown(self):
         """Executed after reach test"""
-        pass
+        self.app.extensions['results'].stop()
 
     """
     TODO
@@ -133,6 +138,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['questions'])
         self.assertTrue((data['total_questions']))
 
+    def test_search_questions_past_last_page(self):
+        res = self.client().post('/questions/search?page=1000',
+                                 json={'searchTerm': 'the'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions'], [])
+
+    def test_search_questions_with_no_matches(self):
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'zzzzzzzz'})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'Not processable')
+
     def test_search_questions_with_no_term(self):
         res = self.client().post('/questions/search',
                                  json={'searchTerm': ''})
@@ -192,6 +214,231 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], 'Not processable')
 
+    # -----------------------------------------------------------------------
+    # query budgets: a page of questions must never load the whole table
+
+    def test_get_questions_query_budget(self):
+        with self.assertQueryBudget(max_statements=4, max_rows=20) as queries:
+            res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertUsesIndexes(queries, ['questions', 'categories'])
+
+    def test_questions_by_category_query_budget(self):
+        with self.assertQueryBudget(max_statements=3, max_rows=20) as queries:
+            res = self.client().get('/categories/1/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertUsesIndexes(queries, ['questions', 'categories'])
+
+    def test_search_questions_query_budget(self):
+        with self.assertQueryBudget(max_statements=1, max_rows=10):
+            res = self.client().post('/questions/search',
+                                     json={'searchTerm': 'the'})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_start_quiz_query_budget(self):
+        with self.assertQueryBudget(max_statements=2, max_rows=2) as queries:
+            res = self.client().post(
+                '/quizzes', json={'previous_questions': [], 'quiz_category': {'id': 1}, })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertUsesIndexes(queries, ['questions', 'categories'])
+
+    def test_index_scan_with_only_a_filter_is_reported(self):
+        plan = {
+            'Node Type': 'Limit',
+            'Plans': [{
+                'Node Type': 'Index Scan',
+                'Relation Name': 'questions',
+                'Index Name': 'questions_pkey',
+                'Filter': '(category = 1)',
+            }]
+        }
+
+        self.assertEqual(seq_scans(plan), ['questions'])
+
+    def test_filter_without_index_fails(self):
+        with QueryRecorder(self._engine()) as queries:
+            with self.app.app_context():
+                Question.query.order_by(Question.id).filter(
+                    Question.difficulty == 1).limit(10).all()
+
+        with self.assertRaises(AssertionError):
+            self.assertUsesIndexes(queries, ['questions'])
+
+    # -----------------------------------------------------------------------
+    # quiz results are buffered in memory and flushed in batches
+
+    def stats(self, path):
+        # (attempts, correct) for a stats endpoint, zeros before any answers
+        res = self.client().get(path)
+        if res.status_code == 404:
+            return (0, 0)
+        data = json.loads(res.data)
+        return (data['stats']['attempts'], data['stats']['correct'])
+
+    def post_results(self, player, answers):
+        return self.client().post('/quizzes/results', json={
+            'player': player,
+            'answers': [{'question_id': question_id, 'correct': correct}
+                        for question_id, correct in answers]})
+
+    def test_record_quiz_results(self):
+        # questions 21 and 22 are both Science, category index 0
+        question_21 = self.stats('/questions/21/stats')
+        question_22 = self.stats('/questions/22/stats')
+        science = self.stats('/categories/0/stats')
+
+        res = self.post_results('carmen', [(21, True), (22, False)])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['recorded'], 2)
+
+        self.app.extensions['results'].flush()
+
+        self.assertEqual(self.stats('/questions/21/stats'),
+                         (question_21[0] + 1, question_21[1] + 1))
+        self.assertEqual(self.stats('/questions/22/stats'),
+                         (question_22[0] + 1, question_22[1]))
+        self.assertEqual(self.stats('/categories/0/stats'),
+                         (science[0] + 2, science[1] + 1))
+
+        res = self.client().get('/categories/0/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['stats']['category_id'], 0)
+
+        res = self.client().get('/quizzes/leaderboard')
+        data = json.loads(res.data)
+        scores = [row['best_score'] for row in data['leaderboard']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['leaderboard'])
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_best_score_is_kept_across_flushes(self):
+        player = 'player-{}'.format(uuid.uuid4().hex)
+        buffer = ResultsBuffer(self.app, interval=3600)
+        self.addCleanup(buffer.stop)
+
+        buffer.record(player, [(21, 1, True), (22, 1, True)])
+        buffer.flush()
+        buffer.record(player, [(21, 1, True), (22, 1, False)])
+        buffer.record(player, [(21, 1, False), (22, 1, False)])
+
+        self.assertEqual(buffer.players[player], [2, 1, 1])
+
+        buffer.flush()
+
+        with self.app.app_context():
+            stats = PlayerStat.query.get(player)
+            self.assertEqual(stats.games, 3)
+            self.assertEqual(stats.correct, 3)
+            self.assertEqual(stats.best_score, 2)
+
+    def test_failed_flush_keeps_counters(self):
+        buffer = ResultsBuffer(self.app, interval=3600)
+        buffer.record('carmen', [(21, 1, True), (22, 1, False)])
+
+        with mock.patch('results._upsert_players',
+                        side_effect=Exception('database is down')):
+            with self.assertRaises(Exception):
+                buffer.flush()
+
+        self.assertEqual(buffer.questions, {21: [1, 1], 22: [1, 0]})
+        self.assertEqual(buffer.categories, {1: [2, 1]})
+        self.assertEqual(buffer.players, {'carmen': [1, 1, 1]})
+
+        # the retry writes the merged counters
+        self.assertEqual(buffer.flush(), 4)
+        buffer.stop()
+
+    def test_pending_results_are_flushed_at_exit(self):
+        question_21 = self.stats('/questions/21/stats')
+
+        buffer = ResultsBuffer(self.app, interval=3600)
+        buffer.record('carmen', [(21, 1, True)])
+
+        results._stop_all()
+
+        self.assertEqual(self.stats('/questions/21/stats'),
+                         (question_21[0] + 1, question_21[1] + 1))
+
+    def test_record_quiz_results_with_non_boolean_correct(self):
+        for correct in ['false', 0, [0]]:
+            res = self.post_results('carmen', [(21, correct)])
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['message'], 'Not processable')
+
+    def test_record_quiz_results_with_too_many_answers(self):
+        res = self.post_results(
+            'carmen', [(question_id, True) for question_id in range(2, 8)])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'Not processable')
+
+    def test_record_quiz_results_with_duplicate_question(self):
+        question_21 = self.stats('/questions/21/stats')
+
+        res = self.post_results('carmen', [(21, True), (21, True)])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'Not processable')
+
+        self.app.extensions['results'].flush()
+        self.assertEqual(self.stats('/questions/21/stats'), question_21)
+
+    def test_record_quiz_results_with_unknown_question(self):
+        question_21 = self.stats('/questions/21/stats')
+
+        res = self.post_results('carmen', [(21, True), (100000, True)])
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'Not processable')
+
+        self.app.extensions['results'].flush()
+        self.assertEqual(self.stats('/questions/21/stats'), question_21)
+
+    def test_record_quiz_results_query_budget(self):
+        with self.assertQueryBudget(max_statements=1, max_rows=2):
+            res = self.client().post('/quizzes/results', json={
+                'player': 'carmen',
+                'answers': [{'question_id': 21, 'correct': True},
+                            {'question_id': 22, 'correct': True}]})
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_record_quiz_results_with_no_answers(self):
+        res = self.client().post('/quizzes/results',
+                                 json={'player': 'carmen', 'answers': []})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Not processable')
+
+    def test_stats_for_unknown_ids(self):
+        res = self.client().get('/questions/100000/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'Not found')
+
+        res = self.client().get('/categories/1000/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['message'], 'Not found')
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -16,7 +16,10 @@ class QuizView extends Component {
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      answers: [],
+      player: '',
+      resultsSent: false
     }
   }
 
@@ -83,6 +86,7 @@ class QuizView extends Component {
     this.setState({
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
       showAnswer: true,
+      answers: [...this.state.answers, { question_id: this.state.currentQuestion.id, correct: evaluate }]
     })
   }
 
@@ -94,7 +98,36 @@ class QuizView extends Component {
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      answers: [],
+      resultsSent: false
+    })
+  }
+
+  submitResults = (event) => {
+    event.preventDefault();
+    if (!this.state.player || this.state.answers.length === 0) { return }
+    $.ajax({
+      url: '/quizzes/results',
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({
+        player: this.state.player,
+        answers: this.state.answers
+      }),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+      success: (result) => {
+        this.setState({ resultsSent: true })
+        return;
+      },
+      error: (error) => {
+        alert('Unable to save your score. Please try your request again')
+        return;
+      }
     })
   }
 
@@ -124,6 +157,14 @@ class QuizView extends Component {
     return (
       <div className="quiz-play-holder">
         <div className="final-header"> Your Final Score is {this.state.numCorrect}</div>
+        {this.state.resultsSent
+          ? <div className="results-sent">Score saved!</div>
+          : (
+            <form onSubmit={this.submitResults}>
+              <input type="text" name="player" placeholder="Your name" value={this.state.player} onChange={this.handleChange} />
+              <input className="submit-guess button" type="submit" value="Save Score" />
+            </form>
+          )}
         <div className="play-again button" onClick={this.restartGame}> Play Again? </div>
       </div>
     )